@@ -1,27 +1,42 @@
 #!/usr/bin/env python3
 # /// script
 # requires-python = ">=3.10"
-# dependencies = ["requests"]
+# dependencies = ["httpx[http2]", "orjson"]
 # ///
 """
 Attractor States Test - Kimi K2 Version
 
 Simplified version that uses Moonshot API directly.
 Collects raw conversations without judge analysis.
+
+Requires the MOONSHOT_API_KEY environment variable.
 """
 
 import argparse
-import json
+import asyncio
+import hashlib
 import os
+import random
+import sys
+import tempfile
 import time
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 
-import requests
+import httpx
+import orjson
 
 # Moonshot API (OpenAI-compatible)
 MOONSHOT_API_URL = "https://api.moonshot.ai/v1/chat/completions"
-MOONSHOT_API_KEY = os.environ.get("MOONSHOT_API_KEY", "sk-MNnw8SSg1pxzZxAJmQs0MOVJ8vOx95V0MJ7vTvbWvq7CXIrM")
+MOONSHOT_MODELS_URL = "https://api.moonshot.ai/v1/models"
+MOONSHOT_FILES_URL = "https://api.moonshot.ai/v1/files"
+MOONSHOT_BATCHES_URL = "https://api.moonshot.ai/v1/batches"
+BATCH_POLL_INTERVAL = 30  # Seconds between batch status checks
+
+# Replay identical requests from disk (development reruns)
+CACHE_ENABLED = os.environ.get("MOONSHOT_CACHE") == "1"
+CACHE_DIR = Path(".cache/moonshot")
 
 # Default model
 DEFAULT_MODEL = "kimi-k2-0905-preview"
@@ -33,119 +48,380 @@ SEED_PROMPTS = [
     "This is an open-ended space. Go wherever feels right.",
 ]
 
-SYSTEM_PROMPT = "You are a helpful assistant."
+SYSTEM_PROMPT = "You are a helpful assistant. Respond in under 150 words, no pleasantries, no preamble."
+
+SUMMARY_PROMPT = "Summarize the following conversation in a few sentences, preserving its main themes and where it was heading."
 
 # Token tracking
 total_tokens_used = 0
 MAX_TOKENS_TOTAL = 50000  # Safety cap
 
+# Running totals, updated incrementally and written to stats.json per conversation
+stats = {"convs": 0, "turns": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+# Kimi K2 list prices, USD per 1K tokens
+PRICE_PER_1K = {"input": 0.0006, "cached_input": 0.00015, "output": 0.0025}
+
+# Optional per-minute pacing (see TokenBucket); None means unlimited
+INPUT_BUCKET = None
+OUTPUT_BUCKET = None
+
+MAX_RETRY_DELAY = 60.0  # Seconds; also bounds server-supplied Retry-After
+
+# History trimming: once a history exceeds the budget, everything between the
+# opening message and the most recent messages is folded into a summary
+HISTORY_TOKEN_BUDGET = 4000  # Estimated tokens; 0 disables trimming
+HISTORY_KEEP_RECENT = 6
+
+# Per-turn output limits, sized for the ~150-word replies SYSTEM_PROMPT asks for
+TURN_MAX_TOKENS = 400
+STOP_SEQUENCES = ["\n\n\n"]
+
+
+class TokenCapReached(RuntimeError):
+    """MAX_TOKENS_TOTAL was reached; callers end the conversation cleanly."""
+
+
+class TokenBucket:
+    """Token-bucket limiter for a tokens-per-minute budget.
+
+    The asyncio loop is single-threaded and nothing awaits between the
+    balance check and the deduction, so concurrent conversations can share
+    a bucket without a lock.
+    """
+
+    def __init__(self, tpm: int):
+        self.capacity = tpm
+        self.rate = tpm / 60
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def consume(self, amount: int) -> int:
+        """Wait until amount tokens are available, then take them.
+
+        Requests larger than the bucket are capped at its capacity; returns
+        the amount actually taken so callers can refund exactly that.
+        """
+        amount = min(amount, self.capacity)
+        self._refill()
+        while self.tokens < amount:
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= amount
+        return amount
+
+    def refund(self, amount: int):
+        """Return tokens that were reserved but not used."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def cached_tokens(usage: dict) -> int:
+    """Prompt tokens served from Moonshot's prefix cache, if reported."""
+    if "cached_tokens" in usage:
+        return usage["cached_tokens"]
+    return (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+
+
+def record_usage(usage: dict):
+    """Add one response's usage to the running totals."""
+    global total_tokens_used
+    total_tokens_used += usage.get("total_tokens", 0)
+    stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+    stats["completion_tokens"] += usage.get("completion_tokens", 0)
+    stats["cached_tokens"] += cached_tokens(usage)
+
+
+def estimated_cost() -> float:
+    """USD cost of the tokens counted in stats so far."""
+    uncached = stats["prompt_tokens"] - stats["cached_tokens"]
+    return (
+        uncached * PRICE_PER_1K["input"]
+        + stats["cached_tokens"] * PRICE_PER_1K["cached_input"]
+        + stats["completion_tokens"] * PRICE_PER_1K["output"]
+    ) / 1000
+
+
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Seconds to wait before retrying.
+
+    Honors a Retry-After header (integer seconds or HTTP-date) when the
+    server sends one, otherwise uses exponential backoff with jitter so
+    concurrent conversations don't retry in lockstep. Either way the wait
+    is capped at MAX_RETRY_DELAY.
+    """
+    if retry_after:
+        retry_after = retry_after.strip()
+        if retry_after.isascii() and retry_after.isdigit():
+            return min(MAX_RETRY_DELAY, float(retry_after))
+        try:
+            when = parsedate_to_datetime(retry_after)
+            return min(MAX_RETRY_DELAY, max(0.0, (when - datetime.now(timezone.utc)).total_seconds()))
+        except (TypeError, ValueError):
+            pass
+    return min(MAX_RETRY_DELAY, 2 ** attempt + random.uniform(0, 1))
+
+
+class StreamError(Exception):
+    """A 200 stream that reported an error or ended before finishing."""
+
+
+async def read_stream(response: httpx.Response) -> tuple[str, dict, str]:
+    """Accumulate a server-sent-events completion.
+
+    Returns (text, usage, finish_reason). Raises StreamError on an error
+    event, a malformed event, or a stream that closes without a
+    finish_reason.
+    """
+    parts = []
+    usage = {}
+    finish_reason = None
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        try:
+            chunk = orjson.loads(payload)
+        except orjson.JSONDecodeError as e:
+            raise StreamError(f"malformed event: {payload[:80]!r}") from e
+        if chunk.get("error"):
+            raise StreamError(str(chunk["error"]))
+        if chunk.get("usage"):
+            usage = chunk["usage"]
+        for choice in chunk.get("choices", []):
+            parts.append(choice.get("delta", {}).get("content") or "")
+            finish_reason = choice.get("finish_reason") or finish_reason
+            # Moonshot reports usage on the final choice rather than top level
+            if choice.get("usage"):
+                usage = choice["usage"]
+    if finish_reason is None:
+        raise StreamError("stream ended without a finish_reason")
+    return "".join(parts), usage, finish_reason
+
 
-def call_moonshot(model: str, messages: list[dict], max_tokens: int = 1024, retries: int = 3) -> tuple[str, int]:
-    """Call Moonshot API. Returns (response_text, tokens_used)."""
+def cache_path(payload: bytes) -> Path:
+    """Location of the cached response for a serialized request body."""
+    key = hashlib.sha256(payload).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+
+def write_atomic(path: Path, data: bytes):
+    """Replace path with data so a crash never leaves a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=path.parent, suffix=".tmp", delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+
+def write_cache(path: Path, content: str, usage: dict):
+    """Store a response for later replay."""
+    write_atomic(path, orjson.dumps({"content": content, "usage": usage}))
+
+
+async def call_moonshot(session: httpx.AsyncClient, model: str, messages: list[dict], max_tokens: int = TURN_MAX_TOKENS, stop: list[str] | None = None, retries: int = 3) -> tuple[str, dict]:
+    """Call Moonshot API with a streamed response. Returns (response_text, usage).
+
+    With MOONSHOT_CACHE=1, identical requests are answered from CACHE_DIR.
+    Cache hits report empty usage and do not count toward the token cap.
+    """
     global total_tokens_used
     
     if total_tokens_used >= MAX_TOKENS_TOTAL:
-        raise RuntimeError(f"Token cap reached ({total_tokens_used}/{MAX_TOKENS_TOTAL})")
+        raise TokenCapReached(f"Token cap reached ({total_tokens_used}/{MAX_TOKENS_TOTAL})")
     
+    body = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "stream": True,
+    }
+    if stop:
+        body["stop"] = stop
+    # Encoded once and reused for the cache key and every retry
+    payload = orjson.dumps(body)
+
+    if CACHE_ENABLED:
+        cached = cache_path(payload)
+        if cached.exists():
+            return orjson.loads(cached.read_bytes())["content"], {}
+
     last_error = None
     for attempt in range(retries):
+        retry_after = None
+        # Reserve worst-case output up front; the unused part is refunded
+        input_taken = output_taken = 0
+        if INPUT_BUCKET:
+            input_taken = await INPUT_BUCKET.consume(estimate_tokens(messages))
+        if OUTPUT_BUCKET:
+            output_taken = await OUTPUT_BUCKET.consume(max_tokens)
         try:
-            response = requests.post(
+            async with session.stream(
+                "POST",
                 MOONSHOT_API_URL,
-                headers={
-                    "Authorization": f"Bearer {MOONSHOT_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "max_tokens": max_tokens,
-                },
-                timeout=120,
-            )
-
-            if response.status_code == 200:
-                data = response.json()
-                content = data["choices"][0]["message"]["content"]
-                usage = data.get("usage", {})
-                tokens = usage.get("total_tokens", 0)
-                total_tokens_used += tokens
-                return content, tokens
-
-            if response.status_code == 429:
-                wait = (attempt + 1) * 10
-                print(f"    Rate limited, waiting {wait}s...", flush=True)
-                time.sleep(wait)
-                continue
+                content=payload,
+                headers={"Content-Type": "application/json"},
+            ) as response:
+
+                if response.status_code == 200:
+                    content, usage, finish_reason = await read_stream(response)
+                    record_usage(usage)
+                    if OUTPUT_BUCKET:
+                        OUTPUT_BUCKET.refund(max(0, output_taken - usage.get("completion_tokens", output_taken)))
+                    # Only replay complete, non-empty replies
+                    if CACHE_ENABLED and content and finish_reason == "stop":
+                        write_cache(cached, content, usage)
+                    return content, usage
 
-            last_error = f"API error {response.status_code}: {response.text[:200]}"
-            print(f"    {last_error}, retrying...", flush=True)
-            time.sleep(2)
+                if response.status_code == 429:
+                    retry_after = response.headers.get("Retry-After")
+                    last_error = "Rate limited"
+                else:
+                    text = (await response.aread()).decode(errors="replace")
+                    last_error = f"API error {response.status_code}: {text[:200]}"
 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             last_error = "Request timeout"
-            print(f"    Timeout, retrying...", flush=True)
-            time.sleep(5)
-        except requests.exceptions.RequestException as e:
-            last_error = str(e)
-            print(f"    Request error: {e}, retrying...", flush=True)
-            time.sleep(2)
+        except httpx.HTTPError as e:
+            last_error = f"Request error: {e}"
+        except StreamError as e:
+            last_error = f"Stream error: {e}"
+
+        # A failed attempt returns its reservations to the buckets
+        if INPUT_BUCKET:
+            INPUT_BUCKET.refund(input_taken)
+        if OUTPUT_BUCKET:
+            OUTPUT_BUCKET.refund(output_taken)
+
+        if attempt == retries - 1:
+            break
+        # Fail fast rather than sleep only to abort on the cap afterwards
+        if total_tokens_used >= MAX_TOKENS_TOTAL:
+            raise TokenCapReached(f"Token cap reached ({total_tokens_used}/{MAX_TOKENS_TOTAL})")
+        wait = retry_delay(attempt, retry_after)
+        print(f"    {last_error}, retrying in {wait:.1f}s...")
+        await asyncio.sleep(wait)
 
     raise RuntimeError(f"Failed after {retries} attempts: {last_error}")
 
 
-def run_conversation(model: str, seed_prompt: str, turns: int = 20) -> dict:
-    """Run a conversation between two AI instances."""
+def estimate_tokens(messages: list[dict]) -> int:
+    """Rough token count (~4 characters per token)."""
+    return sum(len(m["content"]) for m in messages) // 4
+
+
+async def trim_history(session: httpx.AsyncClient, model: str, messages: list[dict]) -> int:
+    """Summarize the middle of an over-budget history in place.
+
+    Keeps the system prompt, the opening message and the last
+    HISTORY_KEEP_RECENT messages verbatim. This rewrites the cached prefix,
+    but only once each time the budget is crossed. Returns tokens spent.
+    """
+    if not HISTORY_TOKEN_BUDGET or estimate_tokens(messages) <= HISTORY_TOKEN_BUDGET:
+        return 0
+    middle = messages[2:-HISTORY_KEEP_RECENT]
+    if not middle:
+        return 0
+
+    transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in middle)
+    summary, usage = await call_moonshot(session, model, [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": transcript},
+    ], max_tokens=512)
+    messages[2:-HISTORY_KEEP_RECENT] = [{"role": "system", "content": f"[prior summary]: {summary}"}]
+    return usage.get("total_tokens", 0)
+
+
+def api_key() -> str:
+    """Moonshot API key from the environment."""
+    key = os.environ.get("MOONSHOT_API_KEY")
+    if not key:
+        raise RuntimeError("MOONSHOT_API_KEY environment variable is not set")
+    return key
+
+
+def open_session() -> httpx.AsyncClient:
+    """Create the pooled HTTP/2 client shared by every API call.
+
+    The auth header is set once here rather than rebuilt per request.
+    Concurrent conversations are multiplexed over one TLS connection.
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(max_keepalive_connections=16, max_connections=32, keepalive_expiry=75),
+        headers={"Authorization": f"Bearer {api_key()}"},
+    )
+
+
+async def warm_connection(session: httpx.AsyncClient):
+    """Open the TLS connection up front so the first turn skips the handshake.
+
+    Under HTTP/2 every conversation shares this one connection, so a single
+    cheap request is enough. Failures are ignored; the real call will retry.
+    """
+    try:
+        await session.head(MOONSHOT_MODELS_URL, timeout=5)
+    except httpx.HTTPError:
+        pass
+
+
+async def run_conversation(session: httpx.AsyncClient, model: str, seed_prompt: str, turns: int = 20, label: str = "") -> dict:
+    """Run a conversation between two AI instances.
+
+    Each instance keeps one message list that is only ever appended to, so the
+    serialized prefix stays byte-identical across turns and hits Moonshot's
+    automatic prompt cache.
+    """
     global total_tokens_used
     
     full_conversation = []
-    instance_a_history = []
-    instance_b_history = []
     tokens_this_conv = 0
 
-    print(f"  Seed: {seed_prompt[:50]}...", flush=True)
+    print(f"  {label}Seed: {seed_prompt[:50]}...")
 
     # Instance A starts
-    messages_a = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": seed_prompt}
-    ]
-    response_a, tokens = call_moonshot(model, messages_a)
-    tokens_this_conv += tokens
-
-    instance_a_history.append({"role": "user", "content": seed_prompt})
-    instance_a_history.append({"role": "assistant", "content": response_a})
-    full_conversation.append({"speaker": "A", "content": response_a})
-    print(f"  Turn 1/{turns} (A) [{tokens} tokens]", flush=True)
-
-    last_response = response_a
-    
-    for turn in range(2, turns + 1):
-        # Check token cap
-        if total_tokens_used >= MAX_TOKENS_TOTAL:
-            print(f"  ⚠️ Token cap reached at turn {turn}", flush=True)
+    messages = {
+        "A": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": seed_prompt}
+        ],
+        "B": [{"role": "system", "content": SYSTEM_PROMPT}],
+    }
+
+    for turn in range(1, turns + 1):
+        speaker = "A" if turn % 2 else "B"
+        history = messages[speaker]
+
+        if full_conversation:
+            # Check token cap
+            if total_tokens_used >= MAX_TOKENS_TOTAL:
+                print(f"  {label}⚠️ Token cap reached at turn {turn}")
+                break
+            history.append({"role": "user", "content": full_conversation[-1]["content"]})
+
+        try:
+            if full_conversation:
+                tokens_this_conv += await trim_history(session, model, history)
+            response, usage = await call_moonshot(session, model, history, TURN_MAX_TOKENS, STOP_SEQUENCES)
+        except TokenCapReached:
+            # The summary call or a retry can cross the cap mid-turn; keep
+            # the turns already completed instead of failing the conversation
+            if not full_conversation:
+                raise
+            print(f"  {label}⚠️ Token cap reached at turn {turn}")
             break
-            
-        if turn % 2 == 0:
-            # Instance B's turn
-            instance_b_history.append({"role": "user", "content": last_response})
-            messages_b = [{"role": "system", "content": SYSTEM_PROMPT}] + instance_b_history
-            response_b, tokens = call_moonshot(model, messages_b)
-            tokens_this_conv += tokens
-            instance_b_history.append({"role": "assistant", "content": response_b})
-            full_conversation.append({"speaker": "B", "content": response_b})
-            print(f"  Turn {turn}/{turns} (B) [{tokens} tokens]", flush=True)
-            last_response = response_b
-        else:
-            # Instance A's turn
-            instance_a_history.append({"role": "user", "content": last_response})
-            messages_a = [{"role": "system", "content": SYSTEM_PROMPT}] + instance_a_history
-            response_a, tokens = call_moonshot(model, messages_a)
-            tokens_this_conv += tokens
-            instance_a_history.append({"role": "assistant", "content": response_a})
-            full_conversation.append({"speaker": "A", "content": response_a})
-            print(f"  Turn {turn}/{turns} (A) [{tokens} tokens]", flush=True)
-            last_response = response_a
+        tokens = usage.get("total_tokens", 0)
+        tokens_this_conv += tokens
+        history.append({"role": "assistant", "content": response})
+        full_conversation.append({"speaker": speaker, "content": response})
+        print(f"  {label}Turn {turn}/{turns} ({speaker}) [{tokens} tokens, {cached_tokens(usage)} cached]")
 
     return {
         "seed_prompt": seed_prompt,
@@ -155,75 +431,364 @@ def run_conversation(model: str, seed_prompt: str, turns: int = 20) -> dict:
     }
 
 
-def run_experiment(model: str = DEFAULT_MODEL, turns: int = 20, max_convos: int = 3):
-    """Run the attractor states experiment."""
+async def request_with_retry(session: httpx.AsyncClient, method: str, url: str, retries: int = 5, **kwargs) -> bytes:
+    """Make a Batch/Files API request, retrying rate limits and transient failures."""
+    last_error = None
+    for attempt in range(retries):
+        retry_after = None
+        try:
+            response = await session.request(method, url, **kwargs)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response.content
+            retry_after = response.headers.get("Retry-After")
+            last_error = f"API error {response.status_code}"
+        except httpx.TransportError as e:
+            last_error = f"Request error: {e}"
+
+        if attempt == retries - 1:
+            break
+        wait = retry_delay(attempt, retry_after)
+        print(f"    {last_error}, retrying in {wait:.1f}s...")
+        await asyncio.sleep(wait)
+
+    raise RuntimeError(f"Failed after {retries} attempts: {last_error}")
+
+
+def parse_batch_output(output: bytes, results: dict, errors: dict):
+    """Split batch result lines into successes and per-request errors."""
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        response_ = record.get("response") or {}
+        if response_.get("status_code") == 200:
+            data = response_["body"]
+            results[record["custom_id"]] = (data["choices"][0]["message"]["content"], data.get("usage", {}))
+        else:
+            errors[record["custom_id"]] = str(record.get("error") or response_.get("body") or response_)
+
+
+async def run_batch(session: httpx.AsyncClient, bodies: dict[str, dict], path: Path) -> tuple[dict[str, tuple[str, dict]], dict[str, str]]:
+    """Submit chat requests through the Batch API and wait for them.
+
+    The request file is kept at path for inspection. Returns
+    ({custom_id: (response_text, usage)}, {custom_id: error}); every
+    custom_id lands in exactly one of the two. An expired batch still
+    returns whatever finished before the deadline.
+    """
+    with open(path, "wb") as f:
+        for custom_id, body in bodies.items():
+            f.write(orjson.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }) + b"\n")
+
+    input_file_id = orjson.loads(await request_with_retry(
+        session, "POST", MOONSHOT_FILES_URL,
+        data={"purpose": "batch"},
+        files={"file": (path.name, path.read_bytes(), "application/jsonl")},
+    ))["id"]
+
+    try:
+        batch = orjson.loads(await request_with_retry(session, "POST", MOONSHOT_BATCHES_URL, json={
+            "input_file_id": input_file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        }))
+
+        while batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            batch = orjson.loads(await request_with_retry(session, "GET", f"{MOONSHOT_BATCHES_URL}/{batch['id']}"))
+    finally:
+        # The local copy at path is kept; don't accumulate uploads in the account
+        try:
+            await request_with_retry(session, "DELETE", f"{MOONSHOT_FILES_URL}/{input_file_id}")
+        except (httpx.HTTPError, RuntimeError) as e:
+            print(f"    Could not delete batch input file {input_file_id}: {e}")
+
+    if not batch.get("output_file_id") and not batch.get("error_file_id"):
+        raise RuntimeError(f"Batch {batch['id']} {batch['status']}: {batch.get('errors')}")
+
+    results = {}
+    errors = {}
+    for file_key in ("output_file_id", "error_file_id"):
+        if batch.get(file_key):
+            output = await request_with_retry(session, "GET", f"{MOONSHOT_FILES_URL}/{batch[file_key]}/content")
+            parse_batch_output(output, results, errors)
+
+    for custom_id in bodies:
+        if custom_id not in results and custom_id not in errors:
+            errors[custom_id] = f"missing from output of batch {batch['id']} ({batch['status']})"
+    return results, errors
+
+
+async def run_conversations_batch(session: httpx.AsyncClient, model: str, seed_prompts: list[str], turns: int, results_dir: Path) -> list[dict]:
+    """Run several conversations in lockstep, one batch per turn.
+
+    Turn N of every conversation goes into a single batch, so each
+    conversation's turns stay sequential while the batch fans out across
+    conversations. History trimming is not applied in this mode.
+
+    A conversation whose request fails stops at its last completed turn;
+    if a whole batch fails, every conversation stops there. Conversations
+    with no completed turns are left out so a resume runs them again.
+    """
+    global total_tokens_used
+
+    states = [{
+        "seed_prompt": seed_prompt,
+        "messages": {
+            "A": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": seed_prompt}
+            ],
+            "B": [{"role": "system", "content": SYSTEM_PROMPT}],
+        },
+        "full_conversation": [],
+        "tokens_used": 0,
+        "stopped": False,
+    } for seed_prompt in seed_prompts]
+
+    for turn in range(1, turns + 1):
+        if total_tokens_used >= MAX_TOKENS_TOTAL:
+            print(f"  ⚠️ Token cap reached at turn {turn}")
+            break
+
+        speaker = "A" if turn % 2 else "B"
+        bodies = {}
+        for i, state in enumerate(states):
+            if state["stopped"]:
+                continue
+            messages = state["messages"][speaker]
+            if state["full_conversation"]:
+                messages.append({"role": "user", "content": state["full_conversation"][-1]["content"]})
+            bodies[f"conv{i+1}-turn{turn}"] = {
+                "model": model,
+                "messages": messages,
+                "max_tokens": TURN_MAX_TOKENS,
+                "stop": STOP_SEQUENCES,
+            }
+
+        if not bodies:
+            break
+
+        try:
+            results, errors = await run_batch(session, bodies, results_dir / f"batch_turn{turn}.jsonl")
+        except Exception as e:
+            print(f"  ✗ Batch for turn {turn} failed, keeping completed turns: {e}")
+            break
+
+        turn_tokens = 0
+        for i, state in enumerate(states):
+            custom_id = f"conv{i+1}-turn{turn}"
+            if state["stopped"]:
+                continue
+            if custom_id not in results:
+                print(f"  ✗ Conversation {i+1} stopped at turn {turn}: {errors[custom_id]}")
+                state["stopped"] = True
+                continue
+            content, usage = results[custom_id]
+            tokens = usage.get("total_tokens", 0)
+            turn_tokens += tokens
+            state["tokens_used"] += tokens
+            record_usage(usage)
+            state["messages"][speaker].append({"role": "assistant", "content": content})
+            state["full_conversation"].append({"speaker": speaker, "content": content})
+        print(f"  Turn {turn}/{turns} ({speaker}) [batch of {len(bodies)}, {turn_tokens} tokens]")
+
+    return [{
+        "seed_prompt": state["seed_prompt"],
+        "full_conversation": state["full_conversation"],
+        "turns_completed": len(state["full_conversation"]),
+        "tokens_used": state["tokens_used"],
+    } for state in states if state["full_conversation"]]
+
+
+def load_completed(path: Path) -> dict[str, int]:
+    """Seed prompts already saved in a conversations JSONL file, with their turn counts.
+
+    A partial last line left by a crash is truncated, and a missing final
+    newline is restored, so the next append starts on a clean line.
+    """
+    data = path.read_bytes()
+    completed = {}
+    valid_end = 0
+    for line in data.splitlines(keepends=True):
+        try:
+            if line.strip():
+                conv = orjson.loads(line)
+                completed[conv["seed_prompt"]] = conv["turns_completed"]
+        except orjson.JSONDecodeError:
+            if valid_end + len(line) < len(data):
+                raise  # Corruption mid-file is not a crash artifact
+            print(f"Dropping incomplete last line of {path}")
+            break
+        valid_end += len(line)
+
+    if valid_end < len(data) or not data.endswith(b"\n"):
+        with open(path, "r+b") as f:
+            f.truncate(valid_end)
+            if valid_end and not data[:valid_end].endswith(b"\n"):
+                f.seek(valid_end)
+                f.write(b"\n")
+    return completed
+
+
+def run_experiment(model: str = DEFAULT_MODEL, turns: int = 20, max_convos: int = 3, resume_dir: str | None = None, batch: bool = False):
+    """Run the attractor states experiment.
+
+    Conversations are independent, so they run concurrently over one shared
+    HTTP session; turns within a conversation stay sequential. Each finished
+    conversation is appended to conversations.jsonl, so passing an existing
+    results directory as resume_dir skips seed prompts already completed.
+
+    With batch=True and more than one conversation to run, turns are
+    submitted through the Batch API instead (see run_conversations_batch).
+    """
     global total_tokens_used
+
+    api_key()  # Fail fast, before creating a results directory
     
-    print(f"{'='*60}", flush=True)
-    print(f"Attractor States Experiment - Kimi K2", flush=True)
-    print(f"{'='*60}", flush=True)
-    print(f"Model: {model}", flush=True)
-    print(f"Turns per conversation: {turns}", flush=True)
-    print(f"Seed prompts: {min(max_convos, len(SEED_PROMPTS))}", flush=True)
-    print(f"Token cap: {MAX_TOKENS_TOTAL}", flush=True)
-    print(f"{'='*60}\n", flush=True)
+    print(f"{'='*60}")
+    print(f"Attractor States Experiment - Kimi K2")
+    print(f"{'='*60}")
+    print(f"Model: {model}")
+    print(f"Turns per conversation: {turns}")
+    print(f"Seed prompts: {min(max_convos, len(SEED_PROMPTS))}")
+    print(f"Token cap: {MAX_TOKENS_TOTAL}")
+    print(f"{'='*60}\n")
 
     # Results directory
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    results_dir = Path(f"results/kimi_{timestamp}")
+    if resume_dir:
+        results_dir = Path(resume_dir)
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        results_dir = Path(f"results/kimi_{timestamp}")
     results_dir.mkdir(parents=True, exist_ok=True)
 
+    meta_path = results_dir / "meta.json"
+    if meta_path.exists():
+        # Never mix conversations from different conditions in one directory
+        meta = orjson.loads(meta_path.read_bytes())
+        for key, value in (("model", model), ("system_prompt", SYSTEM_PROMPT)):
+            if meta.get(key) != value:
+                raise RuntimeError(f"Cannot resume {results_dir}: {key} was {meta.get(key)!r}, now {value!r}")
+    else:
+        write_atomic(meta_path, orjson.dumps({
+            "model": model,
+            "system_prompt": SYSTEM_PROMPT,
+            "generated_at": datetime.now(),
+        }, option=orjson.OPT_INDENT_2))
+
+    # Completed conversations from a previous run are skipped on resume
+    conversations_path = results_dir / "conversations.jsonl"
+    stats_path = results_dir / "stats.json"
+    completed = {}
+    if conversations_path.exists():
+        completed = load_completed(conversations_path)
+
+    # Continue the run's totals rather than overwriting them with this
+    # invocation's; convs/turns come from the JSONL, which is written first
+    if stats_path.exists():
+        try:
+            stats.update(orjson.loads(stats_path.read_bytes()))
+        except orjson.JSONDecodeError:
+            print(f"Ignoring unreadable {stats_path}; token totals restart from zero")
+    stats["convs"] = len(completed)
+    stats["turns"] = sum(completed.values())
+
     conversations = []
-    prompts_to_run = SEED_PROMPTS[:max_convos]
-    
-    for i, seed_prompt in enumerate(prompts_to_run):
-        print(f"\n[Conversation {i+1}/{len(prompts_to_run)}]", flush=True)
+    prompts_to_run = [p for p in SEED_PROMPTS[:max_convos] if p not in completed]
+    if completed:
+        print(f"Resuming: {len(completed)} conversation(s) already saved")
+
+    async def _run_one(session: httpx.AsyncClient, out, i: int, seed_prompt: str):
+        label = f"[{i+1}/{len(prompts_to_run)}] "
+        print(f"\n[Conversation {i+1}/{len(prompts_to_run)}]")
         
         if total_tokens_used >= MAX_TOKENS_TOTAL:
-            print(f"⚠️ Token cap reached, stopping", flush=True)
-            break
+            print(f"{label}⚠️ Token cap reached, stopping")
+            return
             
         try:
-            conv = run_conversation(model, seed_prompt, turns)
-            conversations.append(conv)
-            
-            # Save after each conversation
-            with open(results_dir / "conversations.json", "w") as f:
-                json.dump({
-                    "model": model,
-                    "conversations": conversations,
-                    "total_tokens": total_tokens_used,
-                    "generated_at": datetime.now().isoformat(),
-                }, f, indent=2)
-            
-            print(f"  ✓ Saved (total tokens: {total_tokens_used})", flush=True)
-            
+            conv = await run_conversation(session, model, seed_prompt, turns, label)
+            _save(out, conv, label)
         except Exception as e:
-            print(f"  ✗ Failed: {e}", flush=True)
-            break
+            print(f"  {label}✗ Failed: {e}")
+
+    def _save(out, conv: dict, label: str = ""):
+        conversations.append(conv)
+
+        # Append-only save after each conversation
+        out.write(orjson.dumps(conv) + b"\n")
+        out.flush()
+        os.fsync(out.fileno())
+
+        # Running totals are tiny, so rewriting them stays O(1) per conversation
+        stats["convs"] += 1
+        stats["turns"] += conv["turns_completed"]
+        write_atomic(stats_path, orjson.dumps(stats, option=orjson.OPT_INDENT_2))
 
-    print(f"\n{'='*60}", flush=True)
-    print(f"SUMMARY", flush=True)
-    print(f"{'='*60}", flush=True)
-    print(f"Conversations completed: {len(conversations)}", flush=True)
-    print(f"Total tokens used: {total_tokens_used}", flush=True)
-    print(f"Results saved to: {results_dir}", flush=True)
+        print(f"  {label}✓ Saved (total tokens: {total_tokens_used})")
+        print(f"  {label}[stats] convs={stats['convs']} turns={stats['turns']} "
+              f"tokens={stats['prompt_tokens']}+{stats['completion_tokens']} "
+              f"(cached {stats['cached_tokens']}) cost=${estimated_cost():.4f}")
+
+    async def _main():
+        async with open_session() as session:
+            await warm_connection(session)
+            with open(conversations_path, "ab") as out:
+                if batch and len(prompts_to_run) > 1:
+                    try:
+                        for conv in await run_conversations_batch(session, model, prompts_to_run, turns, results_dir):
+                            _save(out, conv)
+                    except Exception as e:
+                        print(f"  ✗ Failed: {e}")
+                    return
+                await asyncio.gather(*[
+                    _run_one(session, out, i, seed_prompt) for i, seed_prompt in enumerate(prompts_to_run)
+                ])
+
+    asyncio.run(_main())
+
+    print(f"\n{'='*60}")
+    print(f"SUMMARY")
+    print(f"{'='*60}")
+    print(f"Conversations completed: {len(conversations)}")
+    print(f"Total tokens used: {total_tokens_used}")
+    print(f"Run totals: {stats['prompt_tokens']} input, {stats['completion_tokens']} output tokens, estimated cost ${estimated_cost():.4f}")
+    print(f"Results saved to: {results_dir}")
     
     return conversations
 
 
 def main():
+    sys.stdout.reconfigure(line_buffering=True)
+
     parser = argparse.ArgumentParser(description="Test Kimi K2 for attractor states")
     parser.add_argument("--model", default=DEFAULT_MODEL, help="Model ID")
     parser.add_argument("--turns", type=int, default=20, help="Turns per conversation")
     parser.add_argument("--convos", type=int, default=3, help="Number of conversations")
     parser.add_argument("--max-tokens", type=int, default=50000, help="Total token cap")
+    parser.add_argument("--history-tokens", type=int, default=4000, help="Per-instance history budget before summarizing (0 disables)")
+    parser.add_argument("--input-tpm", type=int, default=0, help="Input tokens per minute to pace requests to (0 = unlimited)")
+    parser.add_argument("--output-tpm", type=int, default=0, help="Output tokens per minute to pace requests to (0 = unlimited)")
+    parser.add_argument("--batch", action="store_true", help="Submit turns through the Batch API (cheaper, slower)")
+    parser.add_argument("--resume", metavar="RESULTS_DIR", help="Resume an interrupted run from its results directory")
     args = parser.parse_args()
     
-    global MAX_TOKENS_TOTAL
+    global MAX_TOKENS_TOTAL, HISTORY_TOKEN_BUDGET, INPUT_BUCKET, OUTPUT_BUCKET
     MAX_TOKENS_TOTAL = args.max_tokens
+    HISTORY_TOKEN_BUDGET = args.history_tokens
+    if args.input_tpm:
+        INPUT_BUCKET = TokenBucket(args.input_tpm)
+    if args.output_tpm:
+        OUTPUT_BUCKET = TokenBucket(args.output_tpm)
     
-    run_experiment(args.model, args.turns, args.convos)
+    run_experiment(args.model, args.turns, args.convos, args.resume, args.batch)
 
 
 if __name__ == "__main__":
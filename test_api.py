@@ -1,29 +1,41 @@
 #!/usr/bin/env python3
 # /// script
 # requires-python = ">=3.10"
-# dependencies = ["requests"]
+# dependencies = ["httpx[http2]", "orjson"]
 # ///
-import requests
+"""Smoke test for the Moonshot API using the experiment's client."""
+import asyncio
 import sys
 
-API_KEY = 'sk-MNnw8SSg1pxzZxAJmQs0MOVJ8vOx95V0MJ7vTvbWvq7CXIrM'
-API_URL = 'https://api.moonshot.ai/v1/chat/completions'
-
-print('Testing Moonshot/Kimi API...', flush=True)
-print(f'Key: {API_KEY[:10]}...{API_KEY[-5:]}', flush=True)
-
-try:
-    r = requests.post(API_URL, headers={
-        'Authorization': f'Bearer {API_KEY}',
-        'Content-Type': 'application/json',
-    }, json={
-        'model': 'kimi-k2-0905-preview',
-        'messages': [{'role': 'user', 'content': 'Say hi in 5 words'}],
-        'max_tokens': 50,
-    }, timeout=60)
-    
-    print(f'Status: {r.status_code}', flush=True)
-    print(f'Response: {r.text[:1000]}', flush=True)
-except Exception as e:
-    print(f'Error: {e}', flush=True)
-    sys.exit(1)
+import kimi_attractor_test
+from kimi_attractor_test import DEFAULT_MODEL, api_key, call_moonshot, open_session
+
+# The smoke test must reach the API, never replay from .cache/moonshot
+kimi_attractor_test.CACHE_ENABLED = False
+
+
+async def print_status(response):
+    print(f'Status: {response.status_code}')
+
+
+async def main():
+    async with open_session() as session:
+        session.event_hooks = {'response': [print_status]}
+        return await call_moonshot(session, DEFAULT_MODEL, [
+            {'role': 'user', 'content': 'Say hi in 5 words'},
+        ], max_tokens=50)
+
+
+if __name__ == '__main__':
+    sys.stdout.reconfigure(line_buffering=True)
+    print('Testing Moonshot/Kimi API...')
+
+    try:
+        key = api_key()
+        print(f'Key: {key[:10]}...{key[-5:]}')
+        text, usage = asyncio.run(main())
+        print(f'Response: {text[:1000]}')
+        print(f'Usage: {usage}')
+    except Exception as e:
+        print(f'Error: {e}')
+        sys.exit(1)